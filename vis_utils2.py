@@ -3,11 +3,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
 import os
-
-import keras
-from keras.models import Model
-from keras.layers.wrappers import Wrapper
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 DOT_KWARGS = {"graph_type": "graph",
               "rotate": 90,
@@ -21,33 +22,54 @@ NODE_KWARGS = {"height": 0.5,
                "fontcolor": "white",
                "fontname": "Roboto Light"}
 
-
-LAYER_COLOR_DICT = {
-    keras.engine.input_layer.InputLayer: "grey",
-    keras.layers.core.Reshape: "#F5A286",
-    keras.layers.convolutional.Conv1D: "#F7D7A8",
-    keras.layers.convolutional.Conv2D: "#F7D7A8",
-    keras.layers.pooling.MaxPooling1D: "#AADFA2",
-    keras.layers.pooling.MaxPooling2D: "#AADFA2",
-    keras.layers.convolutional.ZeroPadding2D: "grey",
-    keras.layers.convolutional.ZeroPadding3D: "grey",
-    keras.layers.core.Flatten: "#d44ddb",
-    keras.layers.pooling.AveragePooling2D: "#A8CFE7",
-    keras.layers.pooling.GlobalAveragePooling2D: "#A8CFE7",
-    keras.layers.core.Dropout: "#9896C8",
-    keras.layers.core.Dense: "#C66AA7",
-    keras.layers.advanced_activations.ReLU: "#C66AA7",
-    keras.layers.merge.Concatenate: "#F5A286",
-    keras.engine.training.Model: "#292D30",
-    keras.layers.core.RepeatVector: "grey",
-    keras.layers.merge.Multiply: "grey",
-    keras.layers.merge.Add: "grey",
-    keras.layers.normalization.BatchNormalization: "#add8e6y",
-    keras.layers.recurrent.LSTM: "#A8CFE7",
-    keras.layers.recurrent.GRU: "#ff6961",
-    keras.layers.core.Activation: "#9896C8",
+# Network simplex iteration cap used when `fast_layout=True`.
+FAST_LAYOUT_NSLIMIT = 5
+
+# Models with more layers than this are laid out with `sfdp`
+# instead of `dot` when `prog='auto'`.
+SFDP_MIN_LAYERS = 1000
+
+# Node color of each layer class, keyed by class name.
+COLOR_BY_NAME = {
+    "InputLayer": "grey",
+    "Reshape": "#F5A286",
+    "Conv1D": "#F7D7A8",
+    "Conv2D": "#F7D7A8",
+    "MaxPooling1D": "#AADFA2",
+    "MaxPooling2D": "#AADFA2",
+    "ZeroPadding2D": "grey",
+    "ZeroPadding3D": "grey",
+    "Flatten": "#d44ddb",
+    "AveragePooling2D": "#A8CFE7",
+    "GlobalAveragePooling2D": "#A8CFE7",
+    "Dropout": "#9896C8",
+    "Dense": "#C66AA7",
+    "ReLU": "#C66AA7",
+    "Concatenate": "#F5A286",
+    "Model": "#292D30",
+    "RepeatVector": "grey",
+    "Multiply": "grey",
+    "Add": "grey",
+    "BatchNormalization": "#add8e6y",
+    "LSTM": "#A8CFE7",
+    "GRU": "#ff6961",
+    "Activation": "#9896C8",
 }
 
+
+@functools.lru_cache(maxsize=None)
+def _color_for(layer_type):
+    """Return the node color of a layer class.
+
+    Walks the class MRO, so that subclasses of the layers in
+    `COLOR_BY_NAME` get the color of their closest listed parent.
+    """
+    for cls in layer_type.__mro__:
+        if cls.__name__ in COLOR_BY_NAME:
+            return COLOR_BY_NAME[cls.__name__]
+    return 'grey'
+
+
 # `pydot` is an optional dependency,
 # see `extras_require` in `setup.py`.
 try:
@@ -55,9 +77,20 @@ try:
 except ImportError:
     pydot = None
 
+# Result of the GraphViz check, `None` until `_check_pydot` first runs.
+_PYDOT_OK = None
+
+_GRAPHVIZ_MISSING_MESSAGE = (
+    '`pydot` failed to call GraphViz. '
+    'Please install GraphViz (https://www.graphviz.org/) '
+    'and ensure that its executables are in the $PATH.')
+
 
 def _check_pydot():
     """Raise errors if `pydot` or GraphViz unavailable."""
+    global _PYDOT_OK
+    if _PYDOT_OK:
+        return
     if pydot is None:
         raise ImportError(
             'Failed to import `pydot`. '
@@ -67,18 +100,32 @@ def _check_pydot():
         # Attempt to create an image of a blank graph
         # to check the pydot/graphviz installation.
         pydot.Dot.create(pydot.Dot())
+        _PYDOT_OK = True
     except OSError:
-        raise OSError(
-            '`pydot` failed to call GraphViz.'
-            'Please install GraphViz (https://www.graphviz.org/) '
-            'and ensure that its executables are in the $PATH.')
+        _PYDOT_OK = False
+        raise OSError(_GRAPHVIZ_MISSING_MESSAGE)
+
+
+@functools.lru_cache(maxsize=None)
+def _keras_classes():
+    """Import the keras classes on first use, keras loads its backend.
+
+    # Returns
+        A tuple `(Model, Sequential, Wrapper)`.
+    """
+    from keras.layers.wrappers import Wrapper
+    from keras.models import Model
+    from keras.models import Sequential
+    return Model, Sequential, Wrapper
 
 
 def is_model(layer):
+    Model, _, _ = _keras_classes()
     return isinstance(layer, Model)
 
 
 def is_wrapped_model(layer):
+    Model, _, Wrapper = _keras_classes()
     return isinstance(layer, Wrapper) and isinstance(layer.layer, Model)
 
 
@@ -87,19 +134,278 @@ def add_edge(dot, src, dst):
         dot.add_edge(pydot.Edge(src, dst))
 
 
+def _add_edge(dot, edges, src, dst):
+    """Add the edge `src -> dst` to `dot` unless it is in `edges`.
+
+    `dot.get_edge` scans every edge of the graph, so `model_to_dot`
+    tracks the edges it has added in the set `edges` instead.
+    """
+    if (src, dst) not in edges:
+        edges.add((src, dst))
+        dot.add_edge(pydot.Edge(src, dst))
+
+
+def _inbound_layers(model, layer):
+    """Return the layers of `model` feeding into `layer`."""
+    inbound_layers = []
+    for i, node in enumerate(layer._inbound_nodes):
+        node_key = layer.name + '_ib-' + str(i)
+        if node_key in model._network_nodes:
+            inbound_layers.extend(node.inbound_layers)
+    return inbound_layers
+
+
+def _shape_label(shapes):
+    """Format the shapes of a node like `Layer.input_shape` does."""
+    if len(shapes) == 1:
+        return str(shapes[0])
+    return str(shapes)
+
+
+def _layer_shapes(layers):
+    """Compute the input/output shape labels of `layers`.
+
+    Reads the shapes recorded on the layers' inbound nodes in a single
+    traversal. The `input_shape`/`output_shape` properties would each
+    format the shapes of every node again, and signal layers with
+    several shapes by raising.
+
+    # Returns
+        A dict mapping `id(layer)` to `(inputlabels, outputlabels)`,
+        'multiple' standing for layers called with several shapes.
+    """
+    shapes = {}
+    for layer in layers:
+        inputlabels = set()
+        outputlabels = set()
+        for node in layer._inbound_nodes:
+            inputlabels.add(_shape_label(node.input_shapes))
+            outputlabels.add(_shape_label(node.output_shapes))
+        shapes[id(layer)] = (
+            inputlabels.pop() if len(inputlabels) == 1 else 'multiple',
+            outputlabels.pop() if len(outputlabels) == 1 else 'multiple')
+    return shapes
+
+
+def _layer_names(layer):
+    """Return the `(layer_name, class_name)` of `layer`.
+
+    A wrapped layer's name and class are appended to the wrapper's.
+    """
+    _, _, Wrapper = _keras_classes()
+    layer_name = layer.name
+    class_name = layer.__class__.__name__
+    if isinstance(layer, Wrapper):
+        layer_name = f'{layer_name}({layer.layer.name})'
+        child_class_name = layer.layer.__class__.__name__
+        class_name = f'{class_name}({child_class_name})'
+    return layer_name, class_name
+
+
+def _config_key(layer):
+    """Return a hashable summary of the config of `layer`, without its name.
+
+    `None` for layers that do not implement `get_config`.
+    """
+    try:
+        config = dict(layer.get_config())
+    except NotImplementedError:
+        return None
+    config.pop('name', None)
+    return repr(sorted(config.items()))
+
+
+def _node_label(class_name, show_layer_names, shapes=None):
+    """Return the label of a layer's node.
+
+    Nodes show the text after the last ':' of the layer's
+    'name: Class' label, or of its record of shapes, so the layer
+    name itself is never drawn.
+
+    # Arguments
+        class_name: class name of the layer.
+        show_layer_names: whether the label was 'name: Class',
+            which leaves a space before the class name.
+        shapes: `(inputlabels, outputlabels)` of the layer,
+            or `None` to leave the shapes out.
+    """
+    if shapes is not None:
+        inputlabels, outputlabels = shapes
+        return f'}}|{{{{{inputlabels}}}|{{{outputlabels}}}}}'
+    if show_layer_names:
+        return ' ' + class_name
+    return class_name
+
+
+def _quote(value):
+    """Quote `value` as a DOT ID."""
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    value = value.replace('\n', '\\n')
+    return '"{}"'.format(value)
+
+
+def _fast_model_to_dot_str(model,
+                           show_shapes=False,
+                           show_layer_names=True,
+                           dpi=96,
+                           fast_layout=False):
+    """Convert a Keras model to DOT source without building pydot objects.
+
+    Produces the same graph as `model_to_dot` with `expand_nested=False`,
+    but formats the DOT source directly, which is much faster than
+    pydot's object model on large graphs.
+
+    # Returns
+        The DOT source of the graph, as a string.
+    """
+    _, Sequential, _ = _keras_classes()
+    if isinstance(model, Sequential):
+        if not model.built:
+            model.build()
+
+    graph_type = DOT_KWARGS['graph_type']
+    edge_op = ' -- ' if graph_type == 'graph' else ' -> '
+    graph_attrs = dict(DOT_KWARGS, concentrate='true', dpi=dpi)
+    del graph_attrs['graph_type']
+    if fast_layout:
+        graph_attrs['nslimit'] = FAST_LAYOUT_NSLIMIT
+        graph_attrs['nslimit1'] = FAST_LAYOUT_NSLIMIT
+
+    lines = ['{} G {{'.format(graph_type)]
+    lines.extend('{}={};'.format(key, _quote(value))
+                 for key, value in graph_attrs.items())
+    lines.append('node [{}];'.format(', '.join(
+        '{}={}'.format(key, _quote(value))
+        for key, value in NODE_KWARGS.items())))
+
+    layers = model._layers
+    shapes = _layer_shapes(layers) if show_shapes else {}
+    edges = []
+    for layer in layers:
+        layer_id = _quote(id(layer))
+        _, class_name = _layer_names(layer)
+        label = _node_label(class_name, show_layer_names,
+                            shapes.get(id(layer)))
+        lines.append('{} [label={}, color={}];'.format(
+            layer_id, _quote(label), _quote(_color_for(type(layer)))))
+        edges.extend(_quote(id(inbound_layer)) + edge_op + layer_id + ';'
+                     for inbound_layer in _inbound_layers(model, layer))
+
+    # Deduplicate the edges, keeping their order.
+    seen = set()
+    for edge in edges:
+        if edge not in seen:
+            seen.add(edge)
+            lines.append(edge)
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def _select_prog(model, prog, expand_nested=False):
+    """Resolve `prog='auto'` to the GraphViz layout engine for `model`.
+
+    Keeps 'dot' when `expand_nested=True`, 'sfdp' does not draw clusters.
+    """
+    if prog != 'auto':
+        return prog
+    if not expand_nested and len(model._layers) > SFDP_MIN_LAYERS:
+        return 'sfdp'
+    return 'dot'
+
+
+def _popen_graphviz(args, **kwargs):
+    """Start a GraphViz process, with `_check_pydot`'s error if missing."""
+    try:
+        return subprocess.Popen(args, **kwargs)
+    except FileNotFoundError:
+        raise OSError(_GRAPHVIZ_MISSING_MESSAGE)
+
+
+def _render(dot_source, prog, extension):
+    """Render DOT source by piping it to GraphViz through stdin.
+
+    # Returns
+        The rendered image, as bytes.
+
+    # Raises
+        OSError: if GraphViz is not installed or fails to render
+            the graph.
+    """
+    process = _popen_graphviz(['dot', '-K' + prog, '-T' + extension],
+                              stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate(dot_source.encode('utf-8'))
+    if process.returncode != 0:
+        raise OSError(
+            'GraphViz failed to render the plot: %s' % (
+                stderr.decode('utf-8', 'replace')))
+    return stdout
+
+
+def _render_files(prog, extension, paths):
+    """Render DOT files with a single GraphViz process.
+
+    Each `<path>` is rendered to `<path>.<extension>`.
+
+    # Raises
+        OSError: if GraphViz is not installed or fails to render
+            the files.
+    """
+    process = _popen_graphviz(['dot', '-K' + prog,
+                               '-T' + extension, '-O'] + paths,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE)
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        raise OSError(
+            'GraphViz failed to render the plots: %s' % (
+                stderr.decode('utf-8', 'replace')))
+
+
+def _nested_model_to_dot(model,
+                         show_shapes,
+                         show_layer_names,
+                         rankdir,
+                         expand_nested,
+                         subgraph_cache):
+    """Convert a nested Keras model to a `pydot.Cluster`, memoized.
+
+    # Returns
+        A tuple `(cluster, first_node_name, last_node_name)`.
+    """
+    key = id(model)
+    if key not in subgraph_cache:
+        cluster = model_to_dot(model, show_shapes, show_layer_names, rankdir,
+                               expand_nested, subgraph=True,
+                               _subgraph_cache=subgraph_cache)
+        # Skip the `node [...]` defaults statement.
+        nodes = [node for node in cluster.get_nodes()
+                 if node.get_name() != 'node']
+        subgraph_cache[key] = (cluster,
+                               nodes[0].get_name(),
+                               nodes[-1].get_name())
+    return subgraph_cache[key]
+
+
 def model_to_dot(model,
                  show_shapes=False,
                  show_layer_names=True,
                  rankdir='TB',
                  expand_nested=False,
                  dpi=96,
-                 subgraph=False):
+                 subgraph=False,
+                 collapse_identical=False,
+                 fast_layout=False,
+                 _subgraph_cache=None):
     """Convert a Keras model to dot format.
 
     # Arguments
         model: A Keras model instance.
         show_shapes: whether to display shape information.
-        show_layer_names: whether to display layer names.
+        show_layer_names: whether to prefix the labels with the layer
+            names. Only the text after the name is drawn, so the
+            names themselves do not show up in the plot.
         rankdir: `rankdir` argument passed to PyDot,
             a string specifying the format of the plot:
             'TB' creates a vertical plot;
@@ -107,191 +413,374 @@ def model_to_dot(model,
         expand_nested: whether to expand nested models into clusters.
         dpi: dot DPI.
         subgraph: whether to return a pydot.Cluster instance.
+        collapse_identical: whether to draw interchangeable layers,
+            i.e. layers with the same class, config, shapes and color
+            fed by the same (collapsed) inbound layers, as a single
+            node annotated with their count. Only sibling layers
+            fanning out of the same inputs are merged, e.g. identical
+            parallel branches; repeated blocks applied one after the
+            other, as in a ResNet, are drawn in full. Layers of
+            expanded nested models are not collapsed.
+        fast_layout: whether to cap the network simplex iterations
+            of the GraphViz layout (`nslimit`, `nslimit1`). Speeds up
+            the layout of large graphs at some cost in quality.
 
     # Returns
         A `pydot.Dot` instance representing the Keras model or
         a `pydot.Cluster` instance representing nested model if
         `subgraph=True`.
     """
-    from keras.layers.wrappers import Wrapper
-    from keras.models import Model
-    from keras.models import Sequential
-
+    Model, Sequential, _ = _keras_classes()
     _check_pydot()
     if subgraph:
         dot = pydot.Cluster(style='dashed', graph_name=model.name)
         dot.set('label', model.name)
         dot.set('labeljust', 'l')
+        dot.set_node_defaults(**NODE_KWARGS)
     else:
         dot = pydot.Dot(**DOT_KWARGS)
         # dot.set('rankdir', rankdir)
         dot.set('concentrate', True)
         dot.set('dpi', dpi)
-        dot.set_node_defaults(shape='record')
-
-    sub_n_first_node = {}
-    sub_n_last_node = {}
-    sub_w_first_node = {}
-    sub_w_last_node = {}
+        dot.set_node_defaults(**NODE_KWARGS)
+        if fast_layout:
+            dot.set('nslimit', FAST_LAYOUT_NSLIMIT)
+            dot.set('nslimit1', FAST_LAYOUT_NSLIMIT)
+    # The shared node attributes are set as defaults above,
+    # so each node only carries its own label and color.
+
+    # Edges added so far, as `(src, dst)` node names.
+    edges = set()
+
+    # Clusters of the nested models expanded so far, keyed by `id(model)`,
+    # so that a model shared by several parents is only converted once.
+    if _subgraph_cache is None:
+        _subgraph_cache = {}
+
+    # `id`s of the nested models whose cluster was added to `dot`,
+    # so that a model called several times is only drawn once.
+    attached_subgraphs = set()
+
+    # Names of the first and last nodes of each expanded nested model.
+    sub_n_first_name = {}
+    sub_n_last_name = {}
+    sub_w_first_name = {}
+    sub_w_last_name = {}
 
     if isinstance(model, Sequential):
         if not model.built:
             model.build()
     layers = model._layers
+    shapes = _layer_shapes(layers) if show_shapes else {}
+
+    # Node name of the representative of each collapsed layer.
+    collapsed_id = {}
+    # Representative node, nameless label and count of each group
+    # of identical layers, keyed by their structural signature.
+    identical_groups = {}
+    # Inbound connections as `(inbound_layer, layer, layer_id)`,
+    # connected once all the nodes have been created.
+    edge_buf = []
 
     # Create graph nodes.
-    for i, layer in enumerate(layers):
+    for layer in layers:
         layer_id = str(id(layer))
         layer_type = type(layer)
-
-        # Append a wrapped layer's label to node's label, if it exists.
-        layer_name = layer.name
-        class_name = layer.__class__.__name__
-
-        if isinstance(layer, Wrapper):
-            if expand_nested and isinstance(layer.layer, Model):
-                submodel_wrapper = model_to_dot(layer.layer, show_shapes,
-                                                show_layer_names, rankdir,
-                                                expand_nested,
-                                                subgraph=True)
-                # sub_w : submodel_wrapper
-                sub_w_nodes = submodel_wrapper.get_nodes()
-                sub_w_first_node[layer.layer.name] = sub_w_nodes[0]
-                sub_w_last_node[layer.layer.name] = sub_w_nodes[-1]
+        inbound_layers = _inbound_layers(model, layer)
+        edge_buf.extend((inbound_layer, layer, layer_id)
+                        for inbound_layer in inbound_layers)
+
+        if expand_nested and is_wrapped_model(layer):
+            # sub_w : submodel_wrapper
+            submodel_wrapper, first_name, last_name = _nested_model_to_dot(
+                layer.layer, show_shapes, show_layer_names, rankdir,
+                expand_nested, _subgraph_cache)
+            sub_w_first_name[layer.layer.name] = first_name
+            sub_w_last_name[layer.layer.name] = last_name
+            if id(layer.layer) not in attached_subgraphs:
+                attached_subgraphs.add(id(layer.layer))
                 dot.add_subgraph(submodel_wrapper)
-            else:
-                layer_name = '{}({})'.format(layer_name, layer.layer.name)
-                child_class_name = layer.layer.__class__.__name__
-                class_name = '{}({})'.format(class_name, child_class_name)
+            # The wrapped model is drawn as its own cluster.
+            class_name = layer.__class__.__name__
+        else:
+            _, class_name = _layer_names(layer)
 
         if expand_nested and isinstance(layer, Model):
-            submodel_not_wrapper = model_to_dot(layer, show_shapes,
-                                                show_layer_names, rankdir,
-                                                expand_nested,
-                                                subgraph=True)
             # sub_n : submodel_not_wrapper
-            sub_n_nodes = submodel_not_wrapper.get_nodes()
-            sub_n_first_node[layer.name] = sub_n_nodes[0]
-            sub_n_last_node[layer.name] = sub_n_nodes[-1]
-            dot.add_subgraph(submodel_not_wrapper)
-
-        # Create node's label.
-        if show_layer_names:
-            label = '{}: {}'.format(layer_name, class_name)
-        else:
-            label = class_name
-
-        # Rebuild the label as a table including input/output shapes.
-        if show_shapes:
-            try:
-                outputlabels = str(layer.output_shape)
-            except AttributeError:
-                outputlabels = 'multiple'
-            if hasattr(layer, 'input_shape'):
-                inputlabels = str(layer.input_shape)
-            elif hasattr(layer, 'input_shapes'):
-                inputlabels = ', '.join(
-                    [str(ishape) for ishape in layer.input_shapes])
-            else:
-                inputlabels = 'multiple'
-            label = '%s\n|{input:|output:}|{{%s}|{%s}}' % (label,
-                                                           inputlabels,
-                                                           outputlabels)
+            submodel_not_wrapper, first_name, last_name = _nested_model_to_dot(
+                layer, show_shapes, show_layer_names, rankdir,
+                expand_nested, _subgraph_cache)
+            sub_n_first_name[layer.name] = first_name
+            sub_n_last_name[layer.name] = last_name
+            if id(layer) not in attached_subgraphs:
+                attached_subgraphs.add(id(layer))
+                dot.add_subgraph(submodel_not_wrapper)
 
         if not expand_nested or not isinstance(layer, Model):
-            node = pydot.Node(layer_id,
-                              label=label.split(":")[-1],
-                              color=LAYER_COLOR_DICT.get(layer_type, 'grey'),
-                              **NODE_KWARGS)
-            dot.add_node(node)
-
-    # Connect nodes with edges.
-    for layer in layers:
-        layer_id = str(id(layer))
-        for i, node in enumerate(layer._inbound_nodes):
-            node_key = layer.name + '_ib-' + str(i)
-            if node_key in model._network_nodes:
-                for inbound_layer in node.inbound_layers:
+            label = _node_label(class_name, show_layer_names,
+                                shapes.get(id(layer)))
+            color = _color_for(layer_type)
+            collapse = collapse_identical and not (
+                expand_nested and is_wrapped_model(layer))
+            if collapse:
+                # Merged nodes are labeled with the bare class name.
+                common_label = _node_label(class_name, False,
+                                           shapes.get(id(layer)))
+                # Key on the nodes the inbound layers were drawn as, so
+                # only layers with exactly the same inputs are merged.
+                # Layers come in topological order, so those nodes exist.
+                inbound_ids = []
+                for inbound_layer in inbound_layers:
                     inbound_layer_id = str(id(inbound_layer))
-                    if not expand_nested:
-                        assert dot.get_node(inbound_layer_id)
-                        assert dot.get_node(layer_id)
-                        dot.add_edge(pydot.Edge(inbound_layer_id, layer_id))
-                    else:
-                        # if inbound_layer is not Model or wrapped Model
-                        if not is_model(inbound_layer) and (
-                                not is_wrapped_model(inbound_layer)):
-                            # if current layer is not Model or wrapped Model
-                            if not is_model(layer) and (
-                                    not is_wrapped_model(layer)):
-                                assert dot.get_node(inbound_layer_id)
-                                assert dot.get_node(layer_id)
-                                dot.add_edge(pydot.Edge(inbound_layer_id,
-                                                        layer_id))
-                            # if current layer is Model
-                            elif is_model(layer):
-                                add_edge(dot, inbound_layer_id,
-                                         sub_n_first_node[layer.name].get_name())
-                            # if current layer is wrapped Model
-                            elif is_wrapped_model(layer):
-                                dot.add_edge(pydot.Edge(inbound_layer_id,
-                                                        layer_id))
-                                name = sub_w_first_node[layer.layer.name].get_name()
-                                dot.add_edge(pydot.Edge(layer_id,
-                                                        name))
-                        # if inbound_layer is Model
-                        elif is_model(inbound_layer):
-                            name = sub_n_last_node[inbound_layer.name].get_name()
-                            if is_model(layer):
-                                output_name = sub_n_first_node[layer.name].get_name()
-                                add_edge(dot, name, output_name)
-                            else:
-                                add_edge(dot, name, layer_id)
-                        # if inbound_layer is wrapped Model
-                        elif is_wrapped_model(inbound_layer):
-                            inbound_layer_name = inbound_layer.layer.name
-                            add_edge(dot,
-                                     sub_w_last_node[inbound_layer_name].get_name(),
-                                     layer_id)
+                    inbound_ids.append(collapsed_id.get(inbound_layer_id,
+                                                        inbound_layer_id))
+                signature = (common_label, color, _config_key(layer),
+                             tuple(sorted(inbound_ids)))
+                group = identical_groups.get(signature)
+                if group is not None:
+                    collapsed_id[layer_id] = group[0].get_name()
+                    group[2] += 1
+                    continue
+            node = pydot.Node(layer_id, label=label, color=color)
+            dot.add_node(node)
+            if collapse:
+                identical_groups[signature] = [node, common_label, 1]
+
+    for node, label, count in identical_groups.values():
+        if count > 1:
+            node.set('label', u'{} \u00d7{}'.format(label, count))
+
+    # Connect nodes with edges. Edges refer to the nodes by name,
+    # all of which were added above.
+    for inbound_layer, layer, layer_id in edge_buf:
+        layer_id = collapsed_id.get(layer_id, layer_id)
+        inbound_layer_id = str(id(inbound_layer))
+        inbound_layer_id = collapsed_id.get(inbound_layer_id, inbound_layer_id)
+        # A layer applied to its own output keeps its loop, but an edge
+        # between two merged layers must not become one.
+        if inbound_layer_id == layer_id and inbound_layer is not layer:
+            continue
+        if not expand_nested:
+            _add_edge(dot, edges, inbound_layer_id, layer_id)
+        else:
+            # if inbound_layer is not Model or wrapped Model
+            if not is_model(inbound_layer) and (
+                    not is_wrapped_model(inbound_layer)):
+                # if current layer is not Model or wrapped Model
+                if not is_model(layer) and (
+                        not is_wrapped_model(layer)):
+                    _add_edge(dot, edges, inbound_layer_id, layer_id)
+                # if current layer is Model
+                elif is_model(layer):
+                    _add_edge(dot, edges, inbound_layer_id,
+                              sub_n_first_name[layer.name])
+                # if current layer is wrapped Model
+                elif is_wrapped_model(layer):
+                    _add_edge(dot, edges, inbound_layer_id, layer_id)
+                    name = sub_w_first_name[layer.layer.name]
+                    _add_edge(dot, edges, layer_id, name)
+            # if inbound_layer is Model
+            elif is_model(inbound_layer):
+                name = sub_n_last_name[inbound_layer.name]
+                if is_model(layer):
+                    output_name = sub_n_first_name[layer.name]
+                    _add_edge(dot, edges, name, output_name)
+                else:
+                    _add_edge(dot, edges, name, layer_id)
+            # if inbound_layer is wrapped Model
+            elif is_wrapped_model(inbound_layer):
+                inbound_layer_name = inbound_layer.layer.name
+                _add_edge(dot, edges,
+                          sub_w_last_name[inbound_layer_name],
+                          layer_id)
     return dot
 
 
 def plot_model(model,
-               to_file='model.png',
+               to_file='model.svg',
                show_shapes=False,
                show_layer_names=True,
                rankdir='TB',
                expand_nested=False,
-               dpi=96):
+               dpi=96,
+               collapse_identical=False,
+               fast_layout=False,
+               prog='auto',
+               fast=False):
     """Converts a Keras model to dot format and save to a file.
 
     # Arguments
         model: A Keras model instance
-        to_file: File name of the plot image.
+        to_file: File name of the plot image. Defaults to SVG, also
+            used for names without an extension, which skips
+            GraphViz' rasterizer and stays sharp when zoomed.
         show_shapes: whether to display shape information.
-        show_layer_names: whether to display layer names.
+        show_layer_names: whether to prefix the labels with the layer
+            names. Only the text after the name is drawn, so the
+            names themselves do not show up in the plot.
         rankdir: `rankdir` argument passed to PyDot,
             a string specifying the format of the plot:
             'TB' creates a vertical plot;
             'LR' creates a horizontal plot.
         expand_nested: whether to expand nested models into clusters.
         dpi: dot DPI.
+        collapse_identical: whether to draw interchangeable layers
+            (same class, config, shapes, color and inputs) as a single
+            node annotated with their count. Only sibling layers
+            fanning out of the same inputs are merged, serial repeated
+            blocks are drawn in full.
+        fast_layout: whether to cap the GraphViz layout iterations
+            for large graphs.
+        prog: GraphViz layout engine, e.g. 'dot' or 'sfdp'.
+            'auto' uses 'sfdp' for models with more than
+            `SFDP_MIN_LAYERS` layers and 'dot' otherwise, always
+            'dot' when `expand_nested=True` since 'sfdp' does not
+            draw the nested models' clusters. 'sfdp' also ignores
+            `fast_layout`, which only caps 'dot' iterations.
+        fast: whether to write the DOT source directly instead of
+            building it with pydot. Faster on large models, but
+            does not support `expand_nested` or `collapse_identical`.
 
     # Returns
-        A Jupyter notebook Image object if Jupyter is installed.
+        A Jupyter notebook SVG or Image object if Jupyter is installed.
         This enables in-line display of the model plots in notebooks.
+
+    # Raises
+        ValueError: if `fast=True` is combined with `expand_nested`
+            or `collapse_identical`.
     """
-    dot = model_to_dot(model, show_shapes, show_layer_names, rankdir,
-                       expand_nested, dpi)
+    if fast:
+        if expand_nested or collapse_identical:
+            raise ValueError('`fast=True` does not support `expand_nested` '
+                             'or `collapse_identical`.')
+        dot_source = _fast_model_to_dot_str(model, show_shapes,
+                                            show_layer_names, dpi,
+                                            fast_layout)
+    else:
+        dot = model_to_dot(model, show_shapes, show_layer_names, rankdir,
+                           expand_nested, dpi,
+                           collapse_identical=collapse_identical,
+                           fast_layout=fast_layout)
+        dot_source = dot.to_string()
     _, extension = os.path.splitext(to_file)
     if not extension:
-        extension = 'png'
+        extension = 'svg'
     else:
         extension = extension[1:]
-    dot.write(to_file, format=extension)
-    # Return the image as a Jupyter Image object, to be displayed in-line.
+    image = _render(dot_source, _select_prog(model, prog, expand_nested),
+                    extension)
+    with open(to_file, 'wb') as f:
+        f.write(image)
+    # Return the image as a Jupyter SVG or Image object,
+    # to be displayed in-line.
     try:
         from IPython import display
+        if extension == 'svg':
+            return display.SVG(filename=to_file)
         return display.Image(filename=to_file)
     except ImportError:
         pass
+
+
+def plot_models(models,
+                to_files,
+                show_shapes=False,
+                show_layer_names=True,
+                rankdir='TB',
+                expand_nested=False,
+                dpi=96,
+                collapse_identical=False,
+                fast_layout=False,
+                prog='auto'):
+    """Converts several Keras models to dot format and save them to files.
+
+    Plots sharing an image format and layout engine are split into
+    up to one chunk per CPU, each rendered by a single GraphViz
+    process instead of spawning one process per model. The
+    processes run concurrently.
+
+    # Arguments
+        models: A list of Keras model instances.
+        to_files: A list of file names of the plot images,
+            one per model. Names without an extension are
+            rendered as SVG.
+        show_shapes: whether to display shape information.
+        show_layer_names: whether to prefix the labels with the layer
+            names. Only the text after the name is drawn, so the
+            names themselves do not show up in the plot.
+        rankdir: `rankdir` argument passed to PyDot,
+            a string specifying the format of the plot:
+            'TB' creates a vertical plot;
+            'LR' creates a horizontal plot.
+        expand_nested: whether to expand nested models into clusters.
+        dpi: dot DPI.
+        collapse_identical: whether to draw interchangeable layers
+            (same class, config, shapes, color and inputs) as a single
+            node annotated with their count. Only sibling layers
+            fanning out of the same inputs are merged, serial repeated
+            blocks are drawn in full.
+        fast_layout: whether to cap the GraphViz layout iterations
+            for large graphs.
+        prog: GraphViz layout engine, e.g. 'dot' or 'sfdp'.
+            'auto' uses 'sfdp' for models with more than
+            `SFDP_MIN_LAYERS` layers and 'dot' otherwise, always
+            'dot' when `expand_nested=True` since 'sfdp' does not
+            draw the nested models' clusters. 'sfdp' also ignores
+            `fast_layout`, which only caps 'dot' iterations.
+
+    # Raises
+        ValueError: if `models` and `to_files` differ in length.
+        OSError: if GraphViz fails to render the plots.
+    """
+    if len(models) != len(to_files):
+        raise ValueError('`models` and `to_files` must have the same length, '
+                         'got %d and %d.' % (len(models), len(to_files)))
+    # Group the output files by layout engine and image format,
+    # `dot -O` renders every input file with the same `-K` and `-T` options.
+    by_format = {}
+    for model, to_file in zip(models, to_files):
+        dot = model_to_dot(model, show_shapes, show_layer_names, rankdir,
+                           expand_nested, dpi,
+                           collapse_identical=collapse_identical,
+                           fast_layout=fast_layout)
+        _, extension = os.path.splitext(to_file)
+        if not extension:
+            extension = 'svg'
+        else:
+            extension = extension[1:]
+        key = (_select_prog(model, prog, expand_nested), extension)
+        by_format.setdefault(key, []).append((dot, to_file))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        batches = []
+        for (layout, extension), plots in by_format.items():
+            paths = []
+            for i, (dot, _) in enumerate(plots):
+                path = os.path.join(tmp_dir, '%s_%s_%d.dot' % (layout,
+                                                               extension,
+                                                               i))
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(dot.to_string())
+                paths.append(path)
+            batches.append((layout, extension, paths,
+                            [to_file for _, to_file in plots]))
+
+        # Split each batch into up to one chunk per CPU, rendered by
+        # concurrent GraphViz processes; the threads only wait on
+        # their subprocess.
+        cpu_count = os.cpu_count() or 1
+        chunks = []
+        for layout, extension, paths, _ in batches:
+            size = -(-len(paths) // cpu_count)
+            chunks.extend((layout, extension, paths[i:i + size])
+                          for i in range(0, len(paths), size))
+        with ThreadPoolExecutor(max_workers=cpu_count) as executor:
+            list(executor.map(lambda chunk: _render_files(*chunk), chunks))
+
+        # `dot -O` writes `<input>.<extension>` next to each input.
+        for _, extension, paths, batch_files in batches:
+            for path, to_file in zip(paths, batch_files):
+                shutil.move(path + '.' + extension, to_file)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)